@@ -0,0 +1,32 @@
+"""add tenant and subscription status indexes
+
+Revision ID: 3f1a9c2d7b10
+Revises:
+Create Date: 2026-10-15 09:00:00.000000
+
+Tables are created by init_db() on startup, so this first revision only
+adds what create_all() cannot retrofit onto existing tables.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1a9c2d7b10'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_tenants_status', 'tenants', ['status'], if_not_exists=True)
+    op.create_index('ix_tenant_user_status', 'tenants', ['user_id', 'status'], if_not_exists=True)
+    op.create_index('ix_subscriptions_status', 'subscriptions', ['status'], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_subscriptions_status', table_name='subscriptions', if_exists=True)
+    op.drop_index('ix_tenant_user_status', table_name='tenants', if_exists=True)
+    op.drop_index('ix_tenants_status', table_name='tenants', if_exists=True)
@@ -0,0 +1,35 @@
+"""add stripe_events retry bookkeeping
+
+Revision ID: 4b8d2e6a1c73
+Revises: e9a4c7d2b615
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b8d2e6a1c73'
+down_revision: Union[str, None] = 'e9a4c7d2b615'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # init_db()'s create_all may already have created the columns
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('stripe_events')}
+    if 'attempts' not in columns:
+        op.add_column(
+            'stripe_events',
+            sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        )
+    if 'next_attempt_at' not in columns:
+        op.add_column('stripe_events', sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('stripe_events', 'next_attempt_at')
+    op.drop_column('stripe_events', 'attempts')
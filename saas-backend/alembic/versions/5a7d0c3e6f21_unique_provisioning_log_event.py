@@ -0,0 +1,44 @@
+"""make provisioning_logs.stripe_event_id unique
+
+Revision ID: 5a7d0c3e6f21
+Revises: d52b6e0f4a88
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a7d0c3e6f21'
+down_revision: Union[str, None] = 'd52b6e0f4a88'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Racing deliveries may have logged an event twice; keep the first row's id
+    op.execute(
+        """
+        UPDATE provisioning_logs p
+        SET stripe_event_id = NULL
+        WHERE stripe_event_id IS NOT NULL
+          AND id > (
+              SELECT min(q.id) FROM provisioning_logs q
+              WHERE q.stripe_event_id = p.stripe_event_id
+          )
+        """
+    )
+    op.drop_index('ix_provisioning_logs_stripe_event_id', table_name='provisioning_logs', if_exists=True)
+    op.create_index(
+        'ix_provisioning_logs_stripe_event_id', 'provisioning_logs', ['stripe_event_id'], unique=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_provisioning_logs_stripe_event_id', table_name='provisioning_logs')
+    op.create_index(
+        'ix_provisioning_logs_stripe_event_id', 'provisioning_logs', ['stripe_event_id'], unique=False
+    )
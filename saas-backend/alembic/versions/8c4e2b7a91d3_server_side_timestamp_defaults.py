@@ -0,0 +1,45 @@
+"""server-side defaults for created/updated timestamps
+
+Revision ID: 8c4e2b7a91d3
+Revises: 3f1a9c2d7b10
+Create Date: 2026-10-15 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4e2b7a91d3'
+down_revision: Union[str, None] = '3f1a9c2d7b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+UTC_NOW = sa.text("timezone('UTC', now())")
+
+TIMESTAMP_COLUMNS = [
+    ('users', 'created_at'),
+    ('tenants', 'created_at'),
+    ('tenants', 'updated_at'),
+    ('subscriptions', 'created_at'),
+    ('subscriptions', 'updated_at'),
+    ('team_members', 'invited_at'),
+    ('support_tickets', 'created_at'),
+    ('support_tickets', 'updated_at'),
+    ('ticket_messages', 'created_at'),
+    ('backups', 'created_at'),
+    ('provisioning_logs', 'created_at'),
+]
+
+
+def upgrade() -> None:
+    for table, column in TIMESTAMP_COLUMNS:
+        op.alter_column(table, column, server_default=UTC_NOW)
+
+
+def downgrade() -> None:
+    for table, column in TIMESTAMP_COLUMNS:
+        op.alter_column(table, column, server_default=None)
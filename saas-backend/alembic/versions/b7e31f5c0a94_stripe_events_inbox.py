@@ -0,0 +1,41 @@
+"""add stripe_events inbox table
+
+Revision ID: b7e31f5c0a94
+Revises: 5a7d0c3e6f21
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e31f5c0a94'
+down_revision: Union[str, None] = '5a7d0c3e6f21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # init_db()'s create_all may already have created it
+    if sa.inspect(op.get_bind()).has_table('stripe_events'):
+        return
+    op.create_table(
+        'stripe_events',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('type', sa.String(), nullable=False),
+        sa.Column('payload', postgresql.JSONB(), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text("timezone('UTC', now())")),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_stripe_events_status', 'stripe_events', ['status'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stripe_events_status', table_name='stripe_events')
+    op.drop_table('stripe_events')
@@ -0,0 +1,51 @@
+"""store tenants.status as varchar with a check constraint
+
+Revision ID: d52b6e0f4a88
+Revises: 8c4e2b7a91d3
+Create Date: 2026-10-15 11:00:00.000000
+
+The column was a Postgres ENUM ("tenantstatus") holding the Python enum
+member *names* (ACTIVE, PENDING, ...); it now holds the lowercase values.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd52b6e0f4a88'
+down_revision: Union[str, None] = '8c4e2b7a91d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+STATUSES = ('pending', 'provisioning', 'active', 'failed', 'suspended', 'deleted')
+CHECK_SQL = "status IN ({})".format(", ".join(f"'{s}'" for s in STATUSES))
+
+
+def upgrade() -> None:
+    op.alter_column(
+        'tenants', 'status',
+        type_=sa.String(16),
+        postgresql_using='lower(status::text)',
+    )
+    op.execute("UPDATE tenants SET status = 'pending' WHERE status IS NULL")
+    op.alter_column('tenants', 'status', nullable=False)
+    op.execute("DROP TYPE IF EXISTS tenantstatus")
+
+    existing = {c['name'] for c in sa.inspect(op.get_bind()).get_check_constraints('tenants')}
+    if 'ck_tenant_status' not in existing:
+        op.create_check_constraint('ck_tenant_status', 'tenants', CHECK_SQL)
+
+
+def downgrade() -> None:
+    op.drop_constraint('ck_tenant_status', 'tenants', type_='check')
+    tenantstatus = sa.Enum(*(s.upper() for s in STATUSES), name='tenantstatus')
+    tenantstatus.create(op.get_bind(), checkfirst=True)
+    op.alter_column(
+        'tenants', 'status',
+        type_=tenantstatus,
+        nullable=True,
+        postgresql_using='upper(status)::tenantstatus',
+    )
@@ -0,0 +1,29 @@
+"""add stripe_events.claimed_at
+
+Revision ID: e9a4c7d2b615
+Revises: b7e31f5c0a94
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9a4c7d2b615'
+down_revision: Union[str, None] = 'b7e31f5c0a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # init_db()'s create_all may already have created the column
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('stripe_events')}
+    if 'claimed_at' not in columns:
+        op.add_column('stripe_events', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('stripe_events', 'claimed_at')
@@ -4,7 +4,6 @@ Uses ChromaDB (vector search) + Ollama (LLM) + sentence-transformers (embeddings
 """
 from pathlib import Path
 from typing import Optional, AsyncGenerator
-import os
 import json
 import asyncio
 import httpx
@@ -12,6 +11,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
+from .config import settings
 from .database import get_db
 from .auth import get_current_user
 from .models import User
@@ -27,8 +27,8 @@ VECTOR_DB_PATH = AI_DIR / "vector_db"
 COLLECTION_NAME = "ca_knowledge"
 
 # In-cluster: http://ollama-svc:11434  |  Local dev: http://localhost:11434
-OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://ollama-svc:11434")
-OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.2:latest")
+OLLAMA_BASE_URL = settings.OLLAMA_BASE_URL
+OLLAMA_MODEL = settings.OLLAMA_MODEL
 EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
 # ── Pre-load at startup (avoids cold-start timeout on first request) ─────────
@@ -80,8 +80,7 @@ class UserOut(BaseModel):
     id: int
     email: str
 
-    class Config:
-        from_attributes = True
+    model_config = {"from_attributes": True}
 
 
 class LoginResponse(BaseModel):
@@ -8,7 +8,7 @@ from datetime import datetime
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, contains_eager, selectinload
 
 from .auth import get_current_user
 from .database import get_db
@@ -22,7 +22,7 @@ stripe.api_key = settings.STRIPE_SECRET_KEY
 router = APIRouter(tags=["billing"])
 
 # ---------------------------------------------------------------------------
-# Stripe Price ID ↔ Plan mapping  (keep in sync with stripe_webhooks.py)
+# Stripe Price ID ↔ Plan mapping  (shared with stripe_webhooks.py)
 # ---------------------------------------------------------------------------
 PRICE_TO_PLAN: dict[str, str] = {
     "price_1SrGI3PcAaj5IlzyqjJ9kioz": "starter",
@@ -75,6 +75,7 @@ def _customer_id_for_user(user: User, db: Session) -> Optional[str]:
         .filter(Tenant.user_id == user.id)
         .join(Subscription, Subscription.tenant_id == Tenant.id)
         .filter(Subscription.status != "canceled")
+        .options(contains_eager(Tenant.subscription))
         .first()
     )
     return tenant.subscription.stripe_customer_id if tenant and tenant.subscription else None
@@ -85,7 +86,7 @@ def _customer_id_for_user(user: User, db: Session) -> Optional[str]:
 # ---------------------------------------------------------------------------
 
 @router.get("/api/subscriptions")
-async def get_subscriptions(
+def get_subscriptions(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
@@ -93,6 +94,7 @@ async def get_subscriptions(
     tenants = (
         db.query(Tenant)
         .filter(Tenant.user_id == current_user.id)
+        .options(selectinload(Tenant.subscription))
         .all()
     )
 
@@ -144,7 +146,7 @@ async def get_subscriptions(
 # ---------------------------------------------------------------------------
 
 @router.patch("/api/subscriptions/{subscription_id}")
-async def upgrade_plan(
+def upgrade_plan(
     subscription_id: str,
     body: dict,
     current_user: User = Depends(get_current_user),
@@ -188,7 +190,7 @@ async def upgrade_plan(
 # ---------------------------------------------------------------------------
 
 @router.post("/billing/checkout")
-async def create_checkout(
+def create_checkout(
     body: CheckoutRequest,
     current_user: User = Depends(get_current_user),
 ):
@@ -233,7 +235,7 @@ async def create_checkout(
 # ---------------------------------------------------------------------------
 
 @router.post("/billing/checkout/confirm")
-async def confirm_checkout(
+def confirm_checkout(
     body: dict,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -296,7 +298,7 @@ class PortalRequest(BaseModel):
 
 
 @router.post("/billing/portal")
-async def create_portal(
+def create_portal(
     body: PortalRequest = PortalRequest(),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -351,7 +353,7 @@ async def create_portal(
 # ---------------------------------------------------------------------------
 
 @router.get("/billing/invoices")
-async def get_invoices(
+def get_invoices(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
@@ -2,12 +2,15 @@
 Collective Access SaaS Backend - Configuration
 Phase 3: Centralized configuration management
 """
-from dotenv import load_dotenv
-from pydantic_settings import BaseSettings
+from functools import lru_cache
+from pathlib import Path
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
 
-# Load environment variables from .env file
-load_dotenv()
+# Local development only; in Kubernetes every value comes from the Pod env,
+# so skip the dotenv reader entirely when no file is present
+_ENV_FILE = Path(".env")
 
 
 class Settings(BaseSettings):
@@ -46,6 +49,11 @@ class Settings(BaseSettings):
     APP_URL: str = Field(
         description="Public URL of the customer portal"
     )
+    CORS_ALLOWED_ORIGINS: list[str] = Field(
+        default=[],
+        description="Extra browser origins allowed by CORS, besides APP_URL (JSON list; "
+                    "local dev: [\"http://localhost:3000\"])"
+    )
     
     # Kubernetes
     KUBERNETES_IN_CLUSTER: bool = Field(
@@ -109,6 +117,16 @@ class Settings(BaseSettings):
         description="Persistent volume size for CA instances"
     )
     
+    # AI support chat (Ollama)
+    OLLAMA_BASE_URL: str = Field(
+        default="http://ollama-svc:11434",
+        description="Ollama API URL (local dev: http://localhost:11434)"
+    )
+    OLLAMA_MODEL: str = Field(
+        default="llama3.2:latest",
+        description="Ollama model used by the support chat"
+    )
+    
     # Security
     SECRET_KEY: str = Field(
         default="",
@@ -123,10 +141,20 @@ class Settings(BaseSettings):
         description="JWT token expiration time"
     )
     
-    model_config = {
-        "env_file": ".env",
-        "case_sensitive": True,
-        "extra": "ignore"
-    }
+    # .env is read here, once, by the cached constructor below; real
+    # environment variables always take precedence over the file
+    model_config = SettingsConfigDict(
+        env_file=_ENV_FILE if _ENV_FILE.is_file() else None,
+        case_sensitive=True,
+        extra="ignore",
+    )
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide Settings instance (parsed and validated once)"""
+    return Settings()
+
 
-settings = Settings()
+# Backwards-compatible module attribute
+settings = get_settings()
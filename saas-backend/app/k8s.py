@@ -3,15 +3,203 @@ Collective Access SaaS Backend - Kubernetes & Helm Integration
 Phase 3: Automated tenant deployment via Kubernetes API and Helm
 """
 
+import asyncio
 import subprocess
 import logging
+import time
 import json
-from kubernetes import client, config
+import shutil
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import NamedTuple
+from kubernetes import client, config, watch
 from kubernetes.client.rest import ApiException
-from .config import settings
+from kubernetes.stream import stream
+from kubernetes.watch.watch import iter_resp_lines
+from .config import get_settings
 
 logger = logging.getLogger(__name__)
 
+settings = get_settings()
+
+# Settings read on every tenant install, bound once at import
+_DB_HOST = settings.DB_HOST
+_DB_PORT = settings.DB_PORT
+_IMAGE = settings.CA_DOCKER_IMAGE
+_ISSUER = settings.CA_CERT_ISSUER
+_TZ = settings.CA_TIMEZONE
+_CHART = settings.HELM_CHART_PATH
+_STORAGE = settings.CA_STORAGE_SIZE
+
+# Resolved once so Helm calls skip the PATH search
+_HELM = shutil.which("helm") or "helm"
+
+# Helm flags that are identical for every tenant, materialized once
+_INSTALL_FLAGS = (
+    "--create-namespace",
+    "--atomic",
+    "--timeout", "1200s",  # CA first-boot DB install can take 10-20 min
+)
+_STATIC_SET = (
+    "--set", f"database.host={_DB_HOST}",
+    "--set", f"database.port={_DB_PORT}",
+    "--set", f"image={_IMAGE}",
+    "--set", f"certIssuer={_ISSUER}",
+    "--set", f"app.timezone={_TZ}",
+)
+
+# Per-plan Helm values, rendered once; unknown plans get CA_STORAGE_SIZE
+_PLAN_SET = {
+    plan: ("--set", f"storageSize={size}")
+    for plan, size in {
+        "starter": "10Gi",
+        "basic": "20Gi",
+        "pro": "100Gi",
+        "museum": "1Ti",
+    }.items()
+}
+_DEFAULT_PLAN_SET = ("--set", f"storageSize={_STORAGE}")
+
+
+# -------------------------------------------------------------------
+# Watch-backed caches
+# -------------------------------------------------------------------
+
+# Ask the API server for metadata only (PartialObjectMetadata): the caches
+# need names and labels, never specs or Secret data
+_META_LIST = "application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1"
+_META_WATCH = "application/json;as=PartialObjectMetadata;g=meta.k8s.io;v=v1"
+_LIST_PAGE = 500
+
+
+class _WatchExpired(Exception):
+    """The watch's resourceVersion is gone (410); a fresh list is needed"""
+
+
+class _WatchCache:
+    """
+    In-memory index of a resource collection, kept current by a watch on a
+    daemon thread (informer-style). Each object maps to a key taken from
+    its metadata; a key is present while at least one live object maps to
+    it. Lists are paged and both list and watch carry metadata only.
+    Re-lists when the watch expires (410 Gone) or the connection fails.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        api_client: client.ApiClient,
+        path: str,
+        key_fn,
+        label_selector: str | None = None,
+    ):
+        self._name = name
+        self._api = api_client
+        self._path = path
+        self._key_fn = key_fn
+        self._selector = label_selector
+        self._objects: dict[str, object] = {}  # uid -> key
+        self._keys: Counter = Counter()
+        self._lock = threading.Lock()
+        self.synced = threading.Event()
+        threading.Thread(target=self._run, name=f"watch-{name}", daemon=True).start()
+
+    def __contains__(self, key) -> bool:
+        return self.synced.is_set() and self._keys[key] > 0
+
+    def _set(self, uid: str, key) -> None:
+        with self._lock:
+            self._discard(uid)
+            self._objects[uid] = key
+            self._keys[key] += 1
+
+    def _discard(self, uid: str) -> None:
+        key = self._objects.pop(uid, None)
+        if key is not None:
+            self._keys[key] -= 1
+            if self._keys[key] <= 0:
+                del self._keys[key]
+
+    def _get(self, accept: str, **query):
+        """Raw GET on the collection; returns the unread urllib3 response"""
+        return self._api.call_api(
+            self._path,
+            "GET",
+            query_params=[(k, v) for k, v in query.items() if v is not None],
+            header_params={"Accept": accept},
+            auth_settings=["BearerToken"],
+            _return_http_data_only=True,
+            _preload_content=False,
+        )
+
+    def _list(self) -> str:
+        """Replace the index from a paged list; returns its resourceVersion"""
+        objects, token = {}, None
+        while True:
+            page = json.loads(self._get(
+                _META_LIST, labelSelector=self._selector, limit=_LIST_PAGE, **{"continue": token}
+            ).data)
+            for item in page["items"]:
+                objects[item["metadata"]["uid"]] = self._key_fn(item["metadata"])
+            token = page["metadata"].get("continue")
+            if not token:
+                break
+        with self._lock:
+            self._objects = objects
+            self._keys = Counter(objects.values())
+        self.synced.set()
+        return page["metadata"]["resourceVersion"]
+
+    def _watch(self, resource_version: str) -> str:
+        """Apply watch events until the server ends the stream; returns the last resourceVersion"""
+        resp = self._get(
+            _META_WATCH,
+            labelSelector=self._selector,
+            watch="true",
+            resourceVersion=resource_version,
+            allowWatchBookmarks="true",
+            timeoutSeconds=300,
+        )
+        try:
+            for line in iter_resp_lines(resp):
+                event = json.loads(line)
+                meta = event["object"].get("metadata", {})
+                if event["type"] == "ERROR":
+                    if event["object"].get("code") == 410:
+                        raise _WatchExpired()
+                    raise RuntimeError(event["object"].get("message"))
+                if event["type"] == "DELETED":
+                    with self._lock:
+                        self._discard(meta["uid"])
+                elif event["type"] in ("ADDED", "MODIFIED"):
+                    self._set(meta["uid"], self._key_fn(meta))
+                resource_version = meta.get("resourceVersion", resource_version)
+        finally:
+            resp.close()
+            resp.release_conn()
+        return resource_version
+
+    def _run(self):
+        resource_version = None
+        while True:
+            try:
+                if resource_version is None:
+                    resource_version = self._list()
+                resource_version = self._watch(resource_version)
+            except (_WatchExpired, ApiException) as e:
+                resource_version = None
+                if isinstance(e, _WatchExpired) or e.status == 410:
+                    logger.info(f"{self._name} watch expired, re-listing")
+                    continue
+                logger.warning(f"{self._name} watch failed: {e}")
+                time.sleep(5)
+            except Exception as e:
+                resource_version = None
+                logger.warning(f"{self._name} watch failed: {e}")
+                time.sleep(5)
+
 
 # -------------------------------------------------------------------
 # Kubernetes Manager
@@ -31,6 +219,11 @@ class KubernetesManager:
 
             self.core_v1 = client.CoreV1Api()
             self.apps_v1 = client.AppsV1Api()
+            # stream() swaps its ApiClient's request method while a call is
+            # set up; exec gets its own client so shared calls are unaffected
+            self._exec_v1 = client.CoreV1Api(api_client=client.ApiClient())
+            self._namespaces: _WatchCache | None = None
+            self._releases: _WatchCache | None = None
 
         except Exception as e:
             logger.error(f"Failed to initialize Kubernetes client: {e}")
@@ -58,7 +251,49 @@ class KubernetesManager:
             logger.error(f"Failed to create namespace {namespace}: {e}")
             return False
 
+    def start_watches(self):
+        """
+        Start the namespace and Helm release caches. Watches hold their
+        connections open, so they get their own ApiClient.
+        """
+        watch_client = client.ApiClient()
+        self._namespaces = _WatchCache(
+            "namespaces",
+            watch_client,
+            "/api/v1/namespaces",
+            lambda meta: meta["name"],
+        )
+        # Helm 3 keeps one labelled Secret per release revision; the label
+        # selector matches what `helm list` shows by default. Metadata only:
+        # release payloads (chart, values, DB passwords) never reach us
+        self._releases = _WatchCache(
+            "helm-releases",
+            watch_client,
+            "/api/v1/secrets",
+            lambda meta: (meta["namespace"], meta["labels"]["name"]),
+            label_selector="owner=helm,status in (deployed,failed)",
+        )
+
+    def namespace_cached(self, namespace: str) -> bool:
+        """
+        In-memory check against the namespace watch (False if not synced).
+        The watch trails the API server, so a just-deleted namespace can
+        still read as present for a moment.
+        """
+        return self._namespaces is not None and namespace in self._namespaces
+
+    def release_cached(self, release: str, namespace: str) -> bool:
+        """
+        In-memory check against the Helm release watch (False if not synced).
+        Like namespace_cached, it can briefly lag an uninstall.
+        """
+        return self._releases is not None and (namespace, release) in self._releases
+
     def namespace_exists(self, namespace: str) -> bool:
+        # A hit skips the API call (it may trail a deletion by the watch
+        # delay); a miss may be lag after creation, so ask the API
+        if self.namespace_cached(namespace):
+            return True
         try:
             self.core_v1.read_namespace(namespace)
             return True
@@ -68,42 +303,162 @@ class KubernetesManager:
             logger.error(f"Namespace check failed for {namespace}: {e}")
             return False
 
+    def wait_for_pod_ready(self, namespace: str, label_selector: str, timeout: int = 120) -> str | None:
+        """
+        Block until a pod matching label_selector is Running with Ready=True
+        and return its name (None on timeout). Driven by a watch, so it
+        returns as soon as the API server reports readiness; an already
+        ready pod is reported by the watch's initial listing.
+        """
+        w = watch.Watch()
+        try:
+            for event in w.stream(
+                self.core_v1.list_namespaced_pod,
+                namespace=namespace,
+                label_selector=label_selector,
+                timeout_seconds=timeout,
+            ):
+                pod = event["object"]
+                if event["type"] != "DELETED" and _pod_ready(pod):
+                    return pod.metadata.name
+        finally:
+            w.stop()
+        logger.warning(f"No ready pod for {label_selector} in {namespace} after {timeout}s")
+        return None
+
+    def exec_in_pod(
+        self, namespace: str, pod_name: str, command: list[str], timeout: int = 60
+    ) -> tuple[int | None, str, str]:
+        """
+        Run a command in a pod through the API server's exec websocket
+        (no kubectl process). Returns (returncode, stdout, stderr);
+        returncode is None if the command did not finish within timeout.
+        """
+        resp = stream(
+            self._exec_v1.connect_get_namespaced_pod_exec,
+            pod_name,
+            namespace,
+            command=command,
+            stdin=False,
+            stdout=True,
+            stderr=True,
+            tty=False,
+            _preload_content=False,
+        )
+        # Drain output as it arrives (logged live) instead of letting the
+        # client buffer everything until the command exits
+        stdout, stderr = [], []
+        deadline = time.monotonic() + timeout
+        try:
+            while resp.is_open() and time.monotonic() < deadline:
+                resp.update(timeout=1)
+                if resp.peek_stdout():
+                    chunk = resp.read_stdout()
+                    stdout.append(chunk)
+                    for line in chunk.splitlines():
+                        logger.debug(f"[{namespace}/{pod_name}] {line}")
+                if resp.peek_stderr():
+                    stderr.append(resp.read_stderr())
+            returncode = resp.returncode
+        finally:
+            resp.close()
+        return returncode, "".join(stdout), "".join(stderr)
+
     def get_pod_status(self, namespace: str) -> dict:
         try:
-            pods = self.core_v1.list_namespaced_pod(namespace)
+            # Only status.phase is needed: read the raw response instead of
+            # deserializing every pod into V1Pod model objects
+            resp = self.core_v1.list_namespaced_pod(namespace, _preload_content=False)
+            phases = [p.get("status", {}).get("phase") for p in json.loads(resp.data)["items"]]
+            counts = Counter(phases)
             return {
-                "total": len(pods.items),
-                "running": sum(1 for p in pods.items if p.status.phase == "Running"),
-                "pending": sum(1 for p in pods.items if p.status.phase == "Pending"),
-                "failed": sum(1 for p in pods.items if p.status.phase == "Failed"),
+                "total": len(phases),
+                "running": counts["Running"],
+                "pending": counts["Pending"],
+                "failed": counts["Failed"],
             }
         except ApiException as e:
             logger.error(f"Failed to get pod status for {namespace}: {e}")
             return {}
 
 
+def _pod_ready(pod: client.V1Pod) -> bool:
+    if pod.status is None or pod.status.phase != "Running":
+        return False
+    return any(c.type == "Ready" and c.status == "True" for c in pod.status.conditions or [])
+
+
+@lru_cache(maxsize=1)
+def get_k8s() -> KubernetesManager:
+    """
+    Shared KubernetesManager (also usable as a FastAPI dependency).
+    Kubeconfig is loaded once, the API client's connection pool is
+    reused across requests, and the namespace/release watches start here.
+    """
+    k8s = KubernetesManager()
+    k8s.start_watches()
+    return k8s
+
+
 # -------------------------------------------------------------------
 # Helm Manager
 # -------------------------------------------------------------------
 
+class InstallSpec(NamedTuple):
+    """Arguments for one HelmManager.install_tenant call"""
+    tenant_name: str
+    namespace: str
+    domain: str
+    plan: str
+    db_name: str
+    db_user: str
+    db_password: str
+    ca_app_name: str
+    admin_email: str
+
+
+# Concurrent Helm installs for install_many(). Each worker just waits on a
+# helm subprocess, so threads give full parallelism without a process pool.
+_INSTALL_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="helm-install")
+
+
+def _helm(*args: str, check: bool = False) -> subprocess.CompletedProcess:
+    """Run a Helm CLI command, capturing stdout/stderr as text"""
+    # close_fds=False skips closing every descriptor in the child; Python's
+    # own fds are non-inheritable (PEP 446), so none leak into helm anyway
+    return subprocess.run(
+        [_HELM, *args], capture_output=True, text=True, check=check, close_fds=False
+    )
+
+
 class HelmManager:
     """Manages Helm-based tenant installations"""
 
     @staticmethod
     def release_exists(release: str, namespace: str) -> bool:
+        """
+        Check for a deployed/failed release (what `helm list` shows by default).
+        Helm 3 stores each revision as a labelled Secret in the release
+        namespace: answered from the release watch, or one API GET on a miss.
+        """
+        if HelmManager.release_cached(release, namespace):
+            return True
         try:
-            cmd = [
-                "helm", "list",
-                "--namespace", namespace,
-                "--filter", f"^{release}$",
-                "--short"
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            return release in result.stdout.splitlines()
+            secrets = get_k8s().core_v1.list_namespaced_secret(
+                namespace,
+                label_selector=f"owner=helm,name={release},status in (deployed,failed)",
+                limit=1,
+            )
+            return bool(secrets.items)
         except Exception as e:
             logger.error(f"Failed to check Helm release {release}: {e}")
             return False
 
+    @staticmethod
+    def release_cached(release: str, namespace: str) -> bool:
+        """In-memory release check only (no API call)"""
+        return get_k8s().release_cached(release, namespace)
+
     @staticmethod
     def install_tenant(
         tenant_name: str,
@@ -121,21 +476,10 @@ class HelmManager:
         Passes CA-safe app name to chart.
         """
 
-        storage_map = {
-            "starter": "10Gi",
-            "basic": "20Gi",
-            "pro": "100Gi",
-            "museum": "1Ti",
-        }
-        storage_size = storage_map.get(plan, settings.CA_STORAGE_SIZE)
-
-        cmd = [
-            "helm", "upgrade", "--install", tenant_name,
-            settings.HELM_CHART_PATH,
+        args = [
+            "upgrade", "--install", tenant_name, _CHART,
             "--namespace", namespace,
-            "--create-namespace",
-            "--atomic",
-            "--timeout", "1200s",  # CA first-boot DB install can take 10-20 min
+            *_INSTALL_FLAGS,
 
             "--set", f"tenantName={tenant_name}",
             "--set", f"domain={domain}",
@@ -143,24 +487,21 @@ class HelmManager:
             "--set", f"database.name={db_name}",
             "--set", f"database.user={db_user}",
             "--set", f"database.password={db_password}",
-            "--set", f"database.host={settings.DB_HOST}",
-            "--set", f"database.port={settings.DB_PORT}",
 
-            "--set", f"image={settings.CA_DOCKER_IMAGE}",
-            "--set", f"storageSize={storage_size}",
-            "--set", f"certIssuer={settings.CA_CERT_ISSUER}",
+            *_PLAN_SET.get(plan, _DEFAULT_PLAN_SET),
 
-            "--set", f"app.timezone={settings.CA_TIMEZONE}",
             "--set", f"app.adminEmail={admin_email}",
             "--set", f"app.instanceId={tenant_name}",
             "--set", f"app.tenantDisplayName={tenant_name}",
             "--set", f"app.caAppName={ca_app_name}",
+
+            *_STATIC_SET,
         ]
 
-        logger.info(f"Running Helm command: {' '.join(cmd)}")
+        logger.info(f"Running Helm command: helm {' '.join(args)}")
 
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            result = _helm(*args, check=True)
             logger.info(f"Helm install succeeded for {tenant_name}")
             return True, result.stdout
 
@@ -170,19 +511,18 @@ class HelmManager:
                 logger.warning(f"Helm release '{tenant_name}' is locked. Attempting rollback...")
 
                 # Get the last revision number
-                rev_result = subprocess.run(
-                    ["helm", "history", tenant_name, "-n", namespace, "--max=1", "--output=json"],
-                    capture_output=True, text=True, check=True
+                rev_result = _helm(
+                    "history", tenant_name, "-n", namespace, "--max=1", "--output=json",
+                    check=True,
                 )
                 last_rev = json.loads(rev_result.stdout)[-1]["revision"]
                 logger.info(f"Rolling back release '{tenant_name}' to revision {last_rev}")
 
-                subprocess.run(["helm", "rollback", tenant_name, str(last_rev), "-n", namespace],
-                            check=True, capture_output=True, text=True)
+                _helm("rollback", tenant_name, str(last_rev), "-n", namespace, check=True)
                 logger.info(f"Rollback complete for '{tenant_name}', retrying install...")
 
                 # Retry the original install command
-                result_retry = subprocess.run(cmd, capture_output=True, text=True, check=True)
+                result_retry = _helm(*args, check=True)
                 logger.info(f"Helm install succeeded for {tenant_name} after rollback")
                 return True, result_retry.stdout
 
@@ -190,11 +530,29 @@ class HelmManager:
             logger.error(f"Helm install failed for {tenant_name}: {e.stderr}")
             return False, e.stderr
 
+    @staticmethod
+    async def install_many(specs: list[InstallSpec]) -> list[tuple[bool, str]]:
+        """
+        Install independent tenant releases in parallel (bulk provisioning,
+        reconciliation). Results are returned in the order of `specs`.
+        """
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(_INSTALL_POOL, partial(HelmManager.install_tenant, **spec._asdict()))
+                for spec in specs
+            ),
+            return_exceptions=True,
+        )
+        return [
+            (False, str(r)) if isinstance(r, Exception) else r
+            for r in results
+        ]
+
     @staticmethod
     def uninstall_tenant(tenant_name: str, namespace: str) -> tuple[bool, str]:
         try:
-            cmd = ["helm", "uninstall", tenant_name, "--namespace", namespace]
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            result = _helm("uninstall", tenant_name, "--namespace", namespace)
 
             if result.returncode != 0:
                 logger.error(f"Helm uninstall failed for {tenant_name}: {result.stderr}")
@@ -2,13 +2,18 @@
 Collective Access SaaS Backend - Main Application
 Phase 3: FastAPI application with tenant provisioning endpoints
 """
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List
 
-from .config import settings
+from .config import get_settings
 from .database import get_db, init_db
 from .models import Tenant, User, TenantStatus
 from .schemas import (
@@ -19,8 +24,8 @@ from .schemas import (
     HealthCheckResponse
 )
 from .provisioning import TenantProvisioner
-from .stripe_webhooks import StripeWebhookHandler
-from .k8s import KubernetesManager
+from .stripe_webhooks import StripeWebhookHandler, submit_stripe_replay
+from .k8s import KubernetesManager, get_k8s
 from .auth import router as auth_router
 from .tenants import router as tenants_router
 from .billing import router as billing_router
@@ -29,6 +34,8 @@ from .support import router as support_router
 from .backups import router as backups_router
 from .ai_chat import router as ai_chat_router
 
+settings = get_settings()
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -36,17 +43,107 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+# ============================================================================
+# Startup/Shutdown (lifespan)
+# ============================================================================
+
+def _warmup_k8s():
+    """Build the shared Kubernetes client before the first request needs it"""
+    try:
+        get_k8s()
+        logger.info("Kubernetes client initialized")
+    except Exception as e:
+        logger.warning(f"Kubernetes client init failed (non-fatal): {e}")
+
+
+async def _warmup_ollama():
+    """
+    Send a tiny request so the model is loaded into memory before the
+    first real user request hits (avoids cold-start timeout)
+    """
+    try:
+        import httpx
+        async with httpx.AsyncClient(timeout=180.0) as client:
+            from .ai_chat import OLLAMA_BASE_URL, OLLAMA_MODEL
+            logger.info(f"Warming up Ollama model {OLLAMA_MODEL}...")
+            r = await client.post(
+                f"{OLLAMA_BASE_URL}/api/generate",
+                json={"model": OLLAMA_MODEL, "prompt": "hi", "stream": False},
+            )
+            if r.status_code == 200:
+                logger.info("Ollama warm-up complete ✓")
+            else:
+                logger.warning(f"Ollama warm-up returned {r.status_code}")
+    except Exception as e:
+        logger.warning(f"Ollama warm-up failed (non-fatal): {e}")
+
+
+# How often each worker looks for Stripe events due for retry or stranded
+STRIPE_REPLAY_INTERVAL = 60
+
+
+async def _replay_stripe_events_periodically():
+    """
+    Webhooks are acknowledged before they are handled, so Stripe never
+    redelivers: retry failed events and pick up stranded ones here, at
+    startup and then on a timer. Event claims keep replicas from
+    running the same event twice.
+    """
+    while True:
+        try:
+            submit_stripe_replay(limit=100)
+        except Exception as e:
+            logger.warning(f"Stripe event replay could not be queued: {e}")
+        await asyncio.sleep(STRIPE_REPLAY_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize database and connections on startup, clean up on shutdown"""
+    logger.info(f"Starting {settings.APP_NAME} v{settings.APP_VERSION}")
+    try:
+        # Independent blocking probes run side by side in worker threads,
+        # so boot waits for the slowest one rather than their sum
+        await asyncio.gather(
+            asyncio.to_thread(init_db),
+            asyncio.to_thread(_warmup_k8s),
+        )
+        logger.info("Database initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize database: {e}")
+        raise
+
+    ollama_warmup = asyncio.create_task(_warmup_ollama())
+    stripe_replay = asyncio.create_task(_replay_stripe_events_periodically())
+
+    yield
+
+    logger.info("Shutting down gracefully")
+    ollama_warmup.cancel()
+    stripe_replay.cancel()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
-    description="Automated Collective Access SaaS Platform"
+    description="Automated Collective Access SaaS Platform",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In production: specify allowed origins
+    # Explicit allowlist (portal URL + configured extras) instead of "*"
+    allow_origins=tuple(
+        dict.fromkeys(
+            origin.rstrip("/")
+            for origin in (settings.APP_URL, *settings.CORS_ALLOWED_ORIGINS)
+            if origin
+        )
+    ),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -74,49 +171,6 @@ app.include_router(backups_router)
 app.include_router(ai_chat_router)
 
 
-# ============================================================================
-# Startup/Shutdown Events
-# ============================================================================
-
-@app.on_event("startup")
-async def startup_event():
-    """Initialize database and connections on startup"""
-    logger.info(f"Starting {settings.APP_NAME} v{settings.APP_VERSION}")
-    try:
-        init_db()
-        logger.info("Database initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize database: {e}")
-        raise
-
-    # Warm up Ollama: send a tiny request so the model is loaded into memory
-    # before the first real user request hits (avoids cold-start timeout)
-    import asyncio
-    async def _warmup_ollama():
-        try:
-            import httpx
-            async with httpx.AsyncClient(timeout=180.0) as client:
-                from .ai_chat import OLLAMA_BASE_URL, OLLAMA_MODEL
-                logger.info(f"Warming up Ollama model {OLLAMA_MODEL}...")
-                r = await client.post(
-                    f"{OLLAMA_BASE_URL}/api/generate",
-                    json={"model": OLLAMA_MODEL, "prompt": "hi", "stream": False},
-                )
-                if r.status_code == 200:
-                    logger.info("Ollama warm-up complete ✓")
-                else:
-                    logger.warning(f"Ollama warm-up returned {r.status_code}")
-        except Exception as e:
-            logger.warning(f"Ollama warm-up failed (non-fatal): {e}")
-    asyncio.create_task(_warmup_ollama())
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Cleanup on shutdown"""
-    logger.info("Shutting down gracefully")
-
-
 # ============================================================================
 # Health Check Endpoints
 # ============================================================================
@@ -133,7 +187,7 @@ async def root():
 
 
 @app.get("/health", response_model=HealthCheckResponse)
-async def health_check(db: Session = Depends(get_db)):
+def health_check(db: Session = Depends(get_db)):
     """Detailed health check endpoint"""
     try:
         # Test database connection
@@ -146,7 +200,7 @@ async def health_check(db: Session = Depends(get_db)):
     
     try:
         # Test Kubernetes connection
-        k8s = KubernetesManager()
+        k8s = get_k8s()
         k8s.core_v1.list_namespace(limit=1)
         k8s_status = "connected"
     except Exception as e:
@@ -166,23 +220,36 @@ async def health_check(db: Session = Depends(get_db)):
 # ============================================================================
 
 @app.get("/tenants", response_model=TenantListResponse)
-async def list_tenants(
+def list_tenants(
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db)
 ):
     """List all tenants"""
-    tenants = db.query(Tenant).offset(skip).limit(limit).all()
-    total = db.query(Tenant).count()
+    # Page and total in one round trip via a window count
+    rows = (
+        db.query(Tenant, func.count().over().label("total"))
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+    tenants = [row[0] for row in rows]
+    if rows:
+        total = rows[0][1]
+    else:
+        # Page past the end carries no window value; count explicitly
+        total = db.query(Tenant).count() if skip else 0
     
-    return {
-        "tenants": tenants,
-        "total": total
-    }
+    # Validate each row once here and return the response directly, so
+    # FastAPI does not re-validate the whole payload against response_model
+    return ORJSONResponse({
+        "tenants": [TenantResponse.model_validate(t).model_dump() for t in tenants],
+        "total": total,
+    })
 
 
 @app.get("/tenants/{tenant_id}", response_model=TenantResponse)
-async def get_tenant(tenant_id: int, db: Session = Depends(get_db)):
+def get_tenant(tenant_id: int, db: Session = Depends(get_db)):
     """Get tenant details by ID"""
     tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
     
@@ -193,7 +260,7 @@ async def get_tenant(tenant_id: int, db: Session = Depends(get_db)):
 
 
 @app.get("/tenants/namespace/{namespace}", response_model=TenantResponse)
-async def get_tenant_by_namespace(namespace: str, db: Session = Depends(get_db)):
+def get_tenant_by_namespace(namespace: str, db: Session = Depends(get_db)):
     """Get tenant details by namespace"""
     tenant = db.query(Tenant).filter(Tenant.namespace == namespace).first()
     
@@ -204,7 +271,7 @@ async def get_tenant_by_namespace(namespace: str, db: Session = Depends(get_db))
 
 
 @app.post("/tenants/provision", response_model=ProvisioningResponse)
-async def provision_tenant(
+def provision_tenant(
     request: ProvisioningRequest,
     db: Session = Depends(get_db)
 ):
@@ -241,7 +308,7 @@ async def provision_tenant(
 
 
 @app.delete("/tenants/{tenant_id}")
-async def delete_tenant(tenant_id: int, db: Session = Depends(get_db)):
+def delete_tenant(tenant_id: int, db: Session = Depends(get_db)):
     """Delete a tenant"""
     provisioner = TenantProvisioner(db)
     
@@ -255,31 +322,71 @@ async def delete_tenant(tenant_id: int, db: Session = Depends(get_db)):
 # Stripe Webhook Endpoint
 # ============================================================================
 
+# Stripe event payloads are a few KB; anything near this is not from Stripe
+MAX_WEBHOOK_BODY = 1024 * 1024
+
+
+async def _read_limited_body(request: Request, limit: int) -> bytes:
+    """Read the request body into memory, rejecting it (413) past `limit` bytes"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise HTTPException(status_code=413, detail="Payload too large")
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            raise HTTPException(status_code=413, detail="Payload too large")
+    return bytes(body)
+
+
 @app.post("/webhooks/stripe")
 @app.post("/api/stripe/webhook")
 async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
     """
     Stripe webhook endpoint
-    Handles payment events and triggers tenant provisioning
+    Stores the verified event and acknowledges it; tenant provisioning
+    runs on the Stripe dispatch pool, off the request path
     Registered at both /webhooks/stripe and /api/stripe/webhook
     """
+    payload = await _read_limited_body(request, MAX_WEBHOOK_BODY)
     handler = StripeWebhookHandler(db)
-    return await handler.handle_webhook(request)
+    # The event insert is a blocking DB call; keep it off the event loop
+    return await run_in_threadpool(
+        handler.handle_webhook_bytes,
+        payload,
+        request.headers.get("stripe-signature"),
+    )
 
 
 # ============================================================================
 # Admin/Debug Endpoints
 # ============================================================================
 
+@app.post("/admin/stripe-events/replay")
+def replay_stripe_events(limit: int = 100):
+    """
+    Re-run stored Stripe events that failed or were stranded (admin action),
+    ignoring retry backoff and attempt limits. Events may each take
+    minutes, so the batch runs in the background.
+    """
+    if not submit_stripe_replay(limit, force=True):
+        raise HTTPException(status_code=409, detail="A Stripe event replay is already running")
+    return {"status": "accepted", "message": f"Replaying up to {limit} Stripe events"}
+
+
 @app.get("/admin/tenants/{tenant_id}/status")
-async def get_tenant_status(tenant_id: int, db: Session = Depends(get_db)):
+def get_tenant_status(
+    tenant_id: int,
+    db: Session = Depends(get_db),
+    k8s: KubernetesManager = Depends(get_k8s),
+):
     """Get detailed tenant status including Kubernetes pod info"""
     tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
     
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant not found")
     
-    k8s = KubernetesManager()
     pod_status = k8s.get_pod_status(tenant.namespace)
     
     return {
@@ -296,7 +403,7 @@ async def get_tenant_status(tenant_id: int, db: Session = Depends(get_db)):
 
 
 @app.post("/admin/tenants/{tenant_id}/suspend")
-async def suspend_tenant(tenant_id: int, db: Session = Depends(get_db)):
+def suspend_tenant(tenant_id: int, db: Session = Depends(get_db)):
     """Suspend a tenant (admin action)"""
     provisioner = TenantProvisioner(db)
     
@@ -307,7 +414,7 @@ async def suspend_tenant(tenant_id: int, db: Session = Depends(get_db)):
 
 
 @app.post("/admin/tenants/{tenant_id}/resume")
-async def resume_tenant(tenant_id: int, db: Session = Depends(get_db)):
+def resume_tenant(tenant_id: int, db: Session = Depends(get_db)):
     """Resume a suspended tenant (admin action)"""
     provisioner = TenantProvisioner(db)
     
@@ -2,13 +2,24 @@
 Collective Access SaaS Backend - Database Models
 Phase 3: Core data models for tenant and subscription management
 """
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Enum, Text
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Enum, Text, Index, CheckConstraint, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
-from datetime import datetime
+from datetime import datetime, timezone
 import enum
 from .database import Base
 
 
+def _utc_now():
+    """Server-side UTC timestamp (columns are naive DateTime holding UTC)"""
+    return func.timezone("UTC", func.now())
+
+
+def naive_utcnow() -> datetime:
+    """Client-side counterpart of _utc_now(): current UTC time, naive like the columns"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class TenantStatus(str, enum.Enum):
     """Tenant lifecycle states"""
     PENDING = "pending"           # Payment received, not yet deployed
@@ -35,7 +46,7 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
     password_hash = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=_utc_now())
     
     # Relationships
     tenants = relationship("Tenant", back_populates="user")
@@ -46,6 +57,14 @@ class User(Base):
 class Tenant(Base):
     """Collective Access tenant instances"""
     __tablename__ = "tenants"
+    __table_args__ = (
+        # Per-user dashboards filter a user's tenants by status
+        Index("ix_tenant_user_status", "user_id", "status"),
+        CheckConstraint(
+            "status IN ({})".format(", ".join(f"'{s.value}'" for s in TenantStatus)),
+            name="ck_tenant_status",
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -59,7 +78,9 @@ class Tenant(Base):
     
     # Plan and status
     plan = Column(String, nullable=False)  # starter, pro, museum
-    status = Column(Enum(TenantStatus), default=TenantStatus.PENDING)
+    # Plain string (TenantStatus values) rather than a DB enum type: no
+    # ALTER TYPE to add a state, no enum coercion when rows are loaded
+    status = Column(String(16), nullable=False, default=TenantStatus.PENDING.value, index=True)
     
     # Database credentials (stored securely in K8s secrets)
     db_name = Column(String, nullable=False)
@@ -71,8 +92,8 @@ class Tenant(Base):
     ca_admin_password = Column(String)  # Store initial password, user should change
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=_utc_now())
+    updated_at = Column(DateTime, server_default=_utc_now(), onupdate=_utc_now())
     deployed_at = Column(DateTime, nullable=True)
     
     # Relationships
@@ -101,13 +122,13 @@ class Subscription(Base):
     stripe_price_id = Column(String, nullable=False)
     
     # Status
-    status = Column(String, nullable=False)  # active, past_due, canceled, etc.
+    status = Column(String, nullable=False, index=True)  # active, past_due, canceled, etc.
     current_period_start = Column(DateTime, nullable=False)
     current_period_end = Column(DateTime, nullable=False)
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=_utc_now())
+    updated_at = Column(DateTime, server_default=_utc_now(), onupdate=_utc_now())
     canceled_at = Column(DateTime, nullable=True)
     
     # Relationships
@@ -127,7 +148,7 @@ class TeamMember(Base):
     role = Column(String, nullable=False)          # owner | admin | editor | viewer
     status = Column(String, nullable=False, default="pending")  # active | pending
 
-    invited_at = Column(DateTime, default=datetime.utcnow)
+    invited_at = Column(DateTime, server_default=_utc_now())
     joined_at = Column(DateTime, nullable=True)
 
     # Relationships
@@ -148,8 +169,8 @@ class SupportTicket(Base):
     priority = Column(String, nullable=False, default="medium") # low | medium | high | critical
     category = Column(String, nullable=False, default="general")
 
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=_utc_now())
+    updated_at = Column(DateTime, server_default=_utc_now(), onupdate=_utc_now())
 
     messages = relationship("TicketMessage", back_populates="ticket", order_by="TicketMessage.created_at")
     user = relationship("User", back_populates="tickets")
@@ -166,7 +187,7 @@ class TicketMessage(Base):
     author_name = Column(String, nullable=False)
     author_role = Column(String, nullable=False, default="user")  # user | support
     message = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=_utc_now())
 
     ticket = relationship("SupportTicket", back_populates="messages")
 
@@ -183,7 +204,7 @@ class Backup(Base):
     size_mb = Column(Integer, nullable=True)
     storage_location = Column(String, nullable=True)
 
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=_utc_now())
 
     tenant = relationship("Tenant", back_populates="backups")
 
@@ -201,12 +222,30 @@ class ProvisioningLog(Base):
     message = Column(Text, nullable=True)
     error_details = Column(Text, nullable=True)
     
-    # Idempotency
-    stripe_event_id = Column(String, nullable=True, index=True)
+    # Idempotency: one log row per Stripe event, enforced by the database
+    stripe_event_id = Column(String, nullable=True, unique=True, index=True)
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=_utc_now())
     completed_at = Column(DateTime, nullable=True)
     
     # Relationships
     tenant = relationship("Tenant", back_populates="provisioning_logs")
+
+
+class StripeEvent(Base):
+    """Verified Stripe webhook events, stored on receipt and handled in the background"""
+    __tablename__ = "stripe_events"
+    
+    id = Column(String, primary_key=True)  # Stripe event id (evt_...)
+    type = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    status = Column(String(16), nullable=False, default="pending", index=True)  # pending, processing, processed, failed
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at = Column(DateTime, nullable=True)  # when a failed event is due for retry
+    
+    # Timestamps
+    created_at = Column(DateTime, server_default=_utc_now())
+    claimed_at = Column(DateTime, nullable=True)  # when a worker moved it to processing
+    processed_at = Column(DateTime, nullable=True)
@@ -4,13 +4,22 @@ Phase 3: Core provisioning logic for tenant lifecycle management
 """
 
 import logging
-import uuid
 import os
-import subprocess
+import random
+import re
+import secrets
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from datetime import timedelta
+from sqlalchemy import URL, and_, create_engine, exists, false, or_, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DBAPIError, IntegrityError
 from sqlalchemy.orm import Session
 import pymysql
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import MaxRetryError
 from .config import settings
 
 from .models import (
@@ -19,22 +28,71 @@ from .models import (
     ProvisioningLog,
     ProvisioningAction,
     Subscription,
+    naive_utcnow,
 )
-from .k8s import KubernetesManager, HelmManager
+from .k8s import HelmManager, get_k8s
 
 logger = logging.getLogger(__name__)
 
+# Shared by all provisioners: runs the independent namespace / database
+# setup steps side by side (and bounds that work across concurrent webhooks)
+_SETUP_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tenant-setup")
+
+# Tenant database / user names ("ca_" + 8 hex chars). These are spliced
+# into DDL as identifiers, which can't be bound as parameters
+_DB_NAME_RE = re.compile(r"^ca_[0-9a-f]{8}$")
+
+# MySQL errors worth retrying: too many connections, can't connect,
+# server gone away, lost connection (not e.g. access denied)
+_TRANSIENT_MYSQL_ERRORS = {1040, 2003, 2006, 2013}
+_TRANSIENT_HTTP_STATUSES = {429, 500, 503}
+
+_MYSQL_ENGINE_LOCK = threading.Lock()
+
+# A PROVISIONING tenant untouched for this long was left behind by a dead
+# worker (Helm gives up after 20 minutes) and may be taken over by a resume
+_STALE_PROVISIONING = timedelta(hours=1)
+
+
+def _is_transient(exc: Exception) -> bool:
+    if isinstance(exc, DBAPIError):
+        exc = exc.orig
+    if isinstance(exc, ApiException):
+        return exc.status in _TRANSIENT_HTTP_STATUSES
+    if isinstance(exc, pymysql.err.OperationalError):
+        return bool(exc.args) and exc.args[0] in _TRANSIENT_MYSQL_ERRORS
+    return isinstance(exc, MaxRetryError)
+
+
+def _retry(fn, *, max_attempts: int = 6, base: float = 0.5, cap: float = 8.0):
+    """
+    Call fn(), retrying transient MySQL / Kubernetes API failures with
+    decorrelated-jitter backoff: sleep = min(cap, uniform(base, prev * 3)).
+    The jitter keeps a burst of concurrent provisions from retrying in lockstep.
+    """
+    delay = base
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_attempts or not _is_transient(e):
+                raise
+            delay = min(cap, random.uniform(base, delay * 3))
+            logger.warning(f"Transient error ({e}), retry {attempt}/{max_attempts - 1} in {delay:.1f}s")
+            time.sleep(delay)
+
 
 class TenantProvisioner:
     """Handles the complete tenant provisioning lifecycle"""
 
+    # Root engine for tenant databases on the shared MySQL server (lazy)
+    _mysql_engine_instance: Engine | None = None
+    # Tenant databases this process has created or confirmed (with grants)
+    _known_databases: set[str] = set()
+
     def __init__(self, db: Session):
         self.db = db  # PostgreSQL session for backend metadata
-        self.k8s = KubernetesManager()
-
-        # MySQL host/port for tenant databases (per-tenant credentials handled later)
-        self.mysql_host = settings.DB_HOST
-        self.mysql_port = settings.DB_PORT
+        self.k8s = get_k8s()
 
     # ------------------------------------------------------------------
     # Public API
@@ -56,29 +114,32 @@ class TenantProvisioner:
         - CA_APP_NAME-safe identifier for CollectiveAccess (alphanumeric + underscore)
         """
 
-        # Idempotency: Stripe event already processed
-        if stripe_event_id and self._event_processed(stripe_event_id):
-            logger.info(f"Stripe event {stripe_event_id} already processed")
-            tenant = (
-                self.db.query(Tenant)
-                .join(Subscription)
-                .filter(Subscription.stripe_subscription_id == stripe_subscription_id)
-                .first()
-            )
-            return tenant, None
+        now = naive_utcnow()
 
-        # Existing tenant check
-        existing = (
-            self.db.query(Tenant)
+        # Existing tenant for this subscription + whether this Stripe event was
+        # already logged, in one round trip
+        seen = (
+            exists().where(ProvisioningLog.stripe_event_id == stripe_event_id)
+            if stripe_event_id
+            else false()
+        )
+        row = self.db.execute(
+            select(Tenant, seen.label("seen"))
             .join(Subscription)
             .filter(Subscription.stripe_subscription_id == stripe_subscription_id)
-            .first()
-        )
+        ).first()
+        existing, event_seen = row if row else (None, False)
 
         if existing:
+            # Idempotency: Stripe event already processed
             if existing.status == TenantStatus.ACTIVE:
-                logger.info(f"Tenant already active for subscription {stripe_subscription_id}")
+                if event_seen:
+                    logger.info(f"Stripe event {stripe_event_id} already processed")
+                else:
+                    logger.info(f"Tenant already active for subscription {stripe_subscription_id}")
                 return existing, None
+            # Also covers a replay of this same event: its first run logged
+            # the event, then failed or died before the tenant went live
             logger.warning(f"Tenant exists but status={existing.status}, attempting resume")
             return self._resume_provisioning(existing, plan)
 
@@ -86,7 +147,8 @@ class TenantProvisioner:
         # New tenant provisioning
         # ------------------------------------------------------------------
 
-        tenant_suffix = uuid.uuid4().hex[:8]
+        # 8 lowercase hex chars: RFC 1123 and CA_APP_NAME safe
+        tenant_suffix = secrets.token_hex(4)
 
         # Kubernetes namespace: lowercase letters, numbers, hyphens only
         k8s_namespace = f"{settings.KUBERNETES_NAMESPACE_PREFIX}-{tenant_suffix}"
@@ -103,11 +165,12 @@ class TenantProvisioner:
         # Tenant MySQL database credentials
         db_name = f"ca_{tenant_suffix}"
         db_user = f"ca_{tenant_suffix}"
-        db_password = uuid.uuid4().hex
+        db_password = secrets.token_urlsafe(24)
 
         # Generate admin password upfront — stored before deployment so it's
         # never lost even if the post-install step fails
-        ca_admin_password = uuid.uuid4().hex[:12]
+        # Hex keeps it from ever starting with "-" on the caUtils command line
+        ca_admin_password = secrets.token_hex(6)
 
         # Create Tenant object (metadata stored in PostgreSQL)
         tenant = Tenant(
@@ -116,7 +179,9 @@ class TenantProvisioner:
             helm_release_name=helm_release_name,
             domain=domain,
             plan=plan,
-            status=TenantStatus.PENDING,
+            # Committed straight into PROVISIONING: nothing reads the tenant
+            # between creation and the start of deployment
+            status=TenantStatus.PROVISIONING,
             db_name=db_name,
             db_user=db_user,
             db_password=db_password,
@@ -127,6 +192,25 @@ class TenantProvisioner:
         self.db.add(tenant)
         self.db.flush()
 
+        # Provisioning log, claimed atomically for this Stripe event: if a
+        # concurrent delivery already inserted it, no row comes back
+        log = self.db.scalar(
+            pg_insert(ProvisioningLog)
+            .values(
+                tenant_id=tenant.id,
+                action=ProvisioningAction.CREATE,
+                status="started",
+                message=f"Starting provisioning for {helm_release_name}",
+                stripe_event_id=stripe_event_id,
+            )
+            .on_conflict_do_nothing(index_elements=["stripe_event_id"])
+            .returning(ProvisioningLog)
+        )
+        if log is None:
+            self.db.rollback()
+            logger.info(f"Stripe event {stripe_event_id} is already being provisioned")
+            return self._tenant_for_subscription(stripe_subscription_id), None
+
         # Subscription object
         subscription = Subscription(
             tenant_id=tenant.id,
@@ -134,31 +218,22 @@ class TenantProvisioner:
             stripe_customer_id=stripe_customer_id,
             stripe_price_id="",
             status="active",
-            current_period_start=datetime.utcnow(),
-            current_period_end=datetime.utcnow(),
+            current_period_start=now,
+            current_period_end=now,
         )
         self.db.add(subscription)
-
-        # Provisioning log
-        log = ProvisioningLog(
-            tenant_id=tenant.id,
-            action=ProvisioningAction.CREATE,
-            status="started",
-            message=f"Starting provisioning for {helm_release_name}",
-            stripe_event_id=stripe_event_id,
-        )
-        self.db.add(log)
-        self.db.commit()
-
-        tenant.status = TenantStatus.PROVISIONING
-        self.db.commit()
-
         try:
-            # Kubernetes namespace
-            self._ensure_namespace(k8s_namespace)
+            self.db.commit()
+        except IntegrityError:
+            # Same subscription provisioned concurrently under another event
+            # id (e.g. checkout confirm vs. webhook); defer to the winner
+            self.db.rollback()
+            logger.info(f"Subscription {stripe_subscription_id} is already being provisioned")
+            return self._tenant_for_subscription(stripe_subscription_id), None
 
-            # Tenant database
-            self._ensure_database(db_name, db_user, db_password)
+        try:
+            # Kubernetes namespace + tenant database (independent, run concurrently)
+            self._ensure_namespace_and_database(k8s_namespace, db_name, db_user, db_password)
 
             # Helm release / CollectiveAccess deployment
             self._ensure_helm_release(
@@ -178,14 +253,15 @@ class TenantProvisioner:
             # This is fast (~2s) and never times out.
             self._set_ca_password(k8s_namespace, helm_release_name, ca_admin_password)
 
-            # Update tenant metadata
+            # Update tenant metadata (deployment took minutes: stamp it anew)
+            finished = naive_utcnow()
             tenant.status = TenantStatus.ACTIVE
-            tenant.deployed_at = datetime.utcnow()
+            tenant.deployed_at = finished
             # ca_admin_password already set on tenant before deployment
 
             log.status = "completed"
             log.message = f"Successfully provisioned {helm_release_name}"
-            log.completed_at = datetime.utcnow()
+            log.completed_at = finished
 
             self.db.commit()
             logger.info(f"Provisioned tenant {helm_release_name}")
@@ -197,7 +273,7 @@ class TenantProvisioner:
             tenant.status = TenantStatus.FAILED
             log.status = "failed"
             log.error_details = str(e)
-            log.completed_at = datetime.utcnow()
+            log.completed_at = naive_utcnow()
             self.db.commit()
 
             return tenant, str(e)
@@ -207,16 +283,45 @@ class TenantProvisioner:
     # ------------------------------------------------------------------
 
     def _resume_provisioning(self, tenant: Tenant, plan: str) -> tuple[Tenant, str | None]:
+        # Claim the tenant first. A PROVISIONING tenant still belongs to the
+        # run installing it (e.g. checkout confirm racing the webhook): a
+        # second `helm upgrade --install` would hit its pending release
+        if not self._claim_for_resume(tenant):
+            logger.info(f"{tenant.namespace} is being provisioned by another run, not resuming")
+            return tenant, None
+
+        # Common case: everything was created and only the final status
+        # update was lost. Confirmed from memory, without touching the network
+        if (
+            self.k8s.namespace_cached(tenant.namespace)
+            and HelmManager.release_cached(tenant.helm_release_name, tenant.namespace)
+            and tenant.db_name in self._known_databases
+        ):
+            tenant.status = TenantStatus.ACTIVE
+            tenant.deployed_at = tenant.deployed_at or naive_utcnow()
+            self.db.commit()
+            logger.info(f"Resumed {tenant.namespace} (all resources already present)")
+            return tenant, None
+
         try:
-            self._ensure_namespace(tenant.namespace)
-            self._ensure_database(tenant.db_name, tenant.db_user, tenant.db_password)
+            self._ensure_namespace_and_database(
+                tenant.namespace, tenant.db_name, tenant.db_user, tenant.db_password
+            )
             self._ensure_helm_release(
-                tenant.helm_release_name, tenant.namespace, tenant.domain, plan,
-                tenant.db_name, tenant.db_user, tenant.db_password
+                release=tenant.helm_release_name,
+                namespace=tenant.namespace,
+                domain=tenant.domain,
+                plan=plan,
+                db_name=tenant.db_name,
+                db_user=tenant.db_user,
+                db_password=tenant.db_password,
+                # Same suffix as the namespace and database (see provision_tenant)
+                ca_app_name=f"tenant_{tenant.db_name.removeprefix('ca_')}",
+                admin_email=tenant.user.email,
             )
 
             tenant.status = TenantStatus.ACTIVE
-            tenant.deployed_at = datetime.utcnow()
+            tenant.deployed_at = naive_utcnow()
             self.db.commit()
 
             logger.info(f"Resumed provisioning for {tenant.namespace}")
@@ -230,6 +335,45 @@ class TenantProvisioner:
     # Helpers
     # ------------------------------------------------------------------
 
+    def _claim_for_resume(self, tenant: Tenant) -> bool:
+        """
+        Atomically move a failed/pending (or stale PROVISIONING) tenant to
+        PROVISIONING. False if another run owns it or it is already done.
+        Bumps updated_at, which is what marks the claim as fresh.
+        """
+        claimed = self.db.scalar(
+            update(Tenant)
+            .where(
+                Tenant.id == tenant.id,
+                or_(
+                    Tenant.status.in_([TenantStatus.FAILED.value, TenantStatus.PENDING.value]),
+                    and_(
+                        Tenant.status == TenantStatus.PROVISIONING.value,
+                        Tenant.updated_at < naive_utcnow() - _STALE_PROVISIONING,
+                    ),
+                ),
+            )
+            .values(status=TenantStatus.PROVISIONING.value)
+            .returning(Tenant.id)
+        )
+        self.db.commit()
+        return claimed is not None
+
+    def _ensure_namespace_and_database(
+        self, namespace: str, db_name: str, db_user: str, db_password: str
+    ):
+        """
+        Neither step depends on the other, so provisioning waits for the
+        slower one instead of both in sequence. Re-raises the first failure.
+        """
+        futures = [
+            _SETUP_POOL.submit(self._ensure_namespace, namespace),
+            _SETUP_POOL.submit(self._ensure_database, db_name, db_user, db_password),
+        ]
+        wait(futures, return_when=FIRST_EXCEPTION)
+        for future in futures:
+            future.result()
+
     def _ensure_namespace(self, namespace: str):
         if not self.k8s.namespace_exists(namespace):
             logger.info(f"Creating namespace {namespace}")
@@ -237,7 +381,7 @@ class TenantProvisioner:
                 raise Exception("Failed to create namespace")
 
     def _ensure_database(self, db_name: str, db_user: str, db_password: str):
-        if self._database_exists(db_name):
+        if db_name in self._known_databases:
             return
         if not self._create_database(db_name, db_user, db_password):
             raise Exception(f"Failed to create tenant database {db_name}")
@@ -281,38 +425,47 @@ class TenantProvisioner:
     # MySQL helpers for tenant databases
     # ------------------------------------------------------------------
 
-    def _database_exists(self, db_name: str) -> bool:
-        conn = pymysql.connect(
-            host=self.mysql_host,
-            port=self.mysql_port,
-            user="root",
-            password=settings.MYSQL_ROOT_PASSWORD,
-        )
-        try:
-            with conn.cursor() as c:
-                c.execute(
-                    "SELECT SCHEMA_NAME FROM INFORMATION_SCHEMA.SCHEMATA WHERE SCHEMA_NAME=%s",
-                    (db_name,)
-                )
-                return c.fetchone() is not None
-        finally:
-            conn.close()
+    @classmethod
+    def _mysql_engine(cls) -> Engine:
+        """
+        Pooled root connection to the shared MySQL server, created once per
+        process and shared by every provisioner instance.
+        """
+        if cls._mysql_engine_instance is None:
+            with _MYSQL_ENGINE_LOCK:
+                if cls._mysql_engine_instance is None:
+                    cls._mysql_engine_instance = create_engine(
+                        URL.create(
+                            "mysql+pymysql",
+                            username="root",
+                            password=settings.MYSQL_ROOT_PASSWORD,
+                            host=settings.DB_HOST,
+                            port=settings.DB_PORT,
+                        ),
+                        pool_size=5,
+                        max_overflow=10,
+                        pool_pre_ping=True,
+                        pool_recycle=1800,
+                    )
+        return cls._mysql_engine_instance
 
     def _create_database(self, db_name: str, db_user: str, db_password: str) -> bool:
+        for name in (db_name, db_user):
+            if not _DB_NAME_RE.match(name):
+                raise ValueError(f"Invalid tenant database identifier: {name!r}")
+
         try:
-            conn = pymysql.connect(
-                host=self.mysql_host,
-                port=self.mysql_port,
-                user="root",
-                password=settings.MYSQL_ROOT_PASSWORD,
-                autocommit=True,
-            )
-            with conn.cursor() as c:
-                c.execute(f"CREATE DATABASE IF NOT EXISTS `{db_name}`;")
-                c.execute("CREATE USER IF NOT EXISTS %s@'%%' IDENTIFIED BY %s;", (db_user, db_password))
-                c.execute(f"GRANT ALL PRIVILEGES ON `{db_name}`.* TO %s@'%%';", (db_user,))
-                c.execute("FLUSH PRIVILEGES;")
-            conn.close()
+            # Every statement is idempotent, so no existence probe is needed.
+            # No FLUSH PRIVILEGES: CREATE USER / GRANT update the grant tables
+            # in memory themselves.
+            with _retry(self._mysql_engine().connect) as conn:
+                conn.exec_driver_sql(f"CREATE DATABASE IF NOT EXISTS `{db_name}`")
+                conn.exec_driver_sql(
+                    "CREATE USER IF NOT EXISTS %s@'%%' IDENTIFIED BY %s", (db_user, db_password)
+                )
+                conn.exec_driver_sql(f"GRANT ALL PRIVILEGES ON `{db_name}`.* TO %s@'%%'", (db_user,))
+                conn.commit()
+            self._known_databases.add(db_name)
             return True
         except Exception as e:
             logger.error(f"MySQL error: {e}")
@@ -329,32 +482,26 @@ class TenantProvisioner:
         Fast operation (~2s), never conflicts with the installer.
         """
         try:
-            result = subprocess.run(
-                [
-                    "kubectl", "get", "pod", "-n", namespace,
-                    "-l", f"app={tenant_name}",
-                    "-o", "jsonpath={.items[0].metadata.name}"
-                ],
-                capture_output=True, text=True, timeout=30
-            )
-            pod_name = result.stdout.strip()
+            pod_name = _retry(lambda: self.k8s.wait_for_pod_ready(namespace, f"app={tenant_name}"))
             if not pod_name:
                 logger.warning(f"No pod found in {namespace} to set CA password")
                 return False
 
-            result = subprocess.run(
+            # reset-password is idempotent, so a retried exec is harmless
+            returncode, _, stderr = _retry(lambda: self.k8s.exec_in_pod(
+                namespace,
+                pod_name,
                 [
-                    "kubectl", "exec", "-n", namespace, pod_name,
-                    "--", "php", "/var/www/html/ca/support/bin/caUtils",
+                    "php", "/var/www/html/ca/support/bin/caUtils",
                     "reset-password",
                     "--user", "administrator",
                     "--password", password,
                 ],
-                capture_output=True, text=True, timeout=60
-            )
+                timeout=60,
+            ))
 
-            if result.returncode != 0:
-                logger.error(f"reset-password failed: {result.stderr}")
+            if returncode != 0:
+                logger.error(f"reset-password failed (exit {returncode}): {stderr}")
                 return False
 
             logger.info(f"CA admin password set for {tenant_name}")
@@ -369,9 +516,10 @@ class TenantProvisioner:
     # Misc
     # ------------------------------------------------------------------
 
-    def _event_processed(self, stripe_event_id: str) -> bool:
+    def _tenant_for_subscription(self, stripe_subscription_id: str) -> Tenant | None:
         return (
-            self.db.query(ProvisioningLog)
-            .filter(ProvisioningLog.stripe_event_id == stripe_event_id)
-            .first() is not None
+            self.db.query(Tenant)
+            .join(Subscription)
+            .filter(Subscription.stripe_subscription_id == stripe_subscription_id)
+            .first()
         )
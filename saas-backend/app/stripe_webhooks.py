@@ -2,19 +2,93 @@
 Collective Access SaaS Backend - Stripe Webhook Handler
 Phase 3: Payment event processing and tenant lifecycle management
 """
+import hashlib
+import hmac
 import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+import orjson
 import stripe
-from fastapi import Request, HTTPException
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
+from .billing import PLAN_TO_PRICE, PRICE_TO_PLAN
 from .config import settings
+from .database import SessionLocal
 from .provisioning import TenantProvisioner
-from .models import Tenant, Subscription
+from .models import Tenant, TenantStatus, Subscription, StripeEvent, naive_utcnow
 
 logger = logging.getLogger(__name__)
 
 # Initialize Stripe
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
+# Same replay window stripe.Webhook.construct_event applies by default
+SIGNATURE_TOLERANCE = 300
+
+# HMAC-SHA256 keyed with the webhook secret; copied per event so the key
+# schedule is computed once per worker instead of once per webhook
+_MAC_TEMPLATE = hmac.new(settings.STRIPE_WEBHOOK_SECRET.encode(), digestmod=hashlib.sha256)
+
+# Stored events are handled here, at most 4 at once per worker. Each may
+# hold a Helm install for minutes; queued events wait in this pool's own
+# queue, so they never occupy the threadpool that serves sync endpoints
+_DISPATCH_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="stripe-dispatch")
+
+# Replay leaves recent pending events to their queued dispatch, and only
+# takes over a "processing" claim old enough that its worker must have died
+# (a Helm install times out after 20 minutes)
+_REPLAY_PENDING_AFTER = timedelta(minutes=10)
+_STALE_CLAIM_AFTER = timedelta(hours=1)
+
+# Failed events are retried automatically with exponential backoff
+# (1 min, 2 min, 4 min ... capped at 6 h; about two days over all attempts,
+# close to Stripe's own redelivery window). After the last attempt only a
+# forced replay picks them up
+MAX_EVENT_ATTEMPTS = 15
+_RETRY_BASE = timedelta(minutes=1)
+_RETRY_CAP = timedelta(hours=6)
+
+_REPLAY_LOCK = threading.Lock()
+_replay_future: Future | None = None
+
+
+def _verify_signature(payload: bytes, sig_header: str) -> None:
+    """
+    Verify a Stripe-Signature header ("t=<ts>,v1=<sig>[,v1=<sig>...]")
+    against the raw payload. Raises stripe.error.SignatureVerificationError,
+    same as stripe.Webhook.construct_event.
+    """
+    timestamp = None
+    signatures = []
+    for item in sig_header.split(","):
+        key, _, value = item.strip().partition("=")
+        if key == "t":
+            timestamp = value
+        elif key == "v1":
+            signatures.append(value)
+
+    if not timestamp or not timestamp.isdigit() or not signatures:
+        raise stripe.error.SignatureVerificationError(
+            "Unable to extract timestamp and signatures from header", sig_header, payload
+        )
+
+    mac = _MAC_TEMPLATE.copy()
+    mac.update(timestamp.encode() + b"." + payload)
+    expected = mac.hexdigest()
+    if not any(hmac.compare_digest(expected, sig) for sig in signatures):
+        raise stripe.error.SignatureVerificationError(
+            "No signatures found matching the expected signature for payload", sig_header, payload
+        )
+
+    if int(timestamp) < time.time() - SIGNATURE_TOLERANCE:
+        raise stripe.error.SignatureVerificationError(
+            "Timestamp outside the tolerance zone", sig_header, payload
+        )
+
 
 class StripeWebhookHandler:
     """Handles Stripe webhook events"""
@@ -23,39 +97,151 @@ class StripeWebhookHandler:
         self.db = db
         self.provisioner = TenantProvisioner(db)
     
-    async def handle_webhook(self, request: Request) -> dict:
+    def handle_webhook_bytes(self, payload: bytes, sig_header: str | None) -> dict:
         """
         Process incoming Stripe webhooks
         
+        The verified event is stored in stripe_events and handled in the
+        background, so Stripe gets its 200 without waiting on provisioning.
+        
         Args:
-            request: FastAPI Request object
+            payload: Raw request body, exactly as received (signed by Stripe)
+            sig_header: Value of the stripe-signature header
             
         Returns:
             dict: Response message
         """
-        payload = await request.body()
-        sig_header = request.headers.get("stripe-signature")
         
         if not sig_header:
             raise HTTPException(status_code=400, detail="Missing stripe-signature header")
         
         try:
-            # Verify webhook signature
-            event = stripe.Webhook.construct_event(
-                payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
-            )
-        except ValueError:
+            # Verify webhook signature, then parse the same bytes
+            _verify_signature(payload, sig_header)
+            data = orjson.loads(payload)  # JSONDecodeError is a ValueError
+            event_type = data["type"]
+            event_id = data["id"]
+        except (ValueError, KeyError, TypeError):
             logger.error("Invalid payload")
             raise HTTPException(status_code=400, detail="Invalid payload")
         except stripe.error.SignatureVerificationError:
             logger.error("Invalid signature")
             raise HTTPException(status_code=400, detail="Invalid signature")
         
-        event_type = event["type"]
-        event_id = event["id"]
-        
         logger.info(f"Received Stripe event: {event_type} ({event_id})")
         
+        # Stripe retries deliveries; only the first insert of an event schedules work
+        inserted = self.db.scalar(
+            pg_insert(StripeEvent)
+            .values(id=event_id, type=event_type, payload=data, status="pending")
+            .on_conflict_do_nothing(index_elements=["id"])
+            .returning(StripeEvent.id)
+        )
+        self.db.commit()
+        
+        if inserted is None:
+            logger.info(f"Duplicate delivery of {event_id}, already queued")
+        else:
+            # Row is committed, so the dispatcher's own session will see it
+            _DISPATCH_POOL.submit(process_stripe_event, event_id)
+        
+        return {"status": "success"}
+    
+    def dispatch(self, event_id: str) -> None:
+        """
+        Run the handler for a newly stored event and record the outcome on
+        its stripe_events row. Failed events keep their error for a replay.
+        """
+        record = self._claim(StripeEvent.id == event_id, StripeEvent.status == "pending")
+        if record is None:
+            return  # already handled, or taken over by a replay
+        self._finish(record)
+    
+    def replay(self, limit: int = 100, force: bool = False) -> int:
+        """
+        Re-run stored events that failed or were stranded (worker restart,
+        outage), oldest first. Each event is claimed before it runs, so
+        nothing still queued or in flight runs twice, and its outcome is
+        committed as soon as it finishes. Failed events are only taken once
+        their backoff has elapsed, unless `force` (which also revives events
+        out of attempts). Returns the number of events run.
+        """
+        candidates = self.db.scalars(
+            select(StripeEvent.id)
+            .where(self._replayable(force))
+            .order_by(StripeEvent.created_at)
+            .limit(limit)
+        ).all()
+        
+        replayed = 0
+        for event_id in candidates:
+            # Re-checked in the claim: a dispatcher may have taken it meanwhile
+            record = self._claim(StripeEvent.id == event_id, self._replayable(force))
+            if record is None:
+                continue
+            self._finish(record)
+            replayed += 1
+        return replayed
+    
+    @staticmethod
+    def _replayable(force: bool = False):
+        now = naive_utcnow()
+        failed = StripeEvent.status == "failed"
+        if not force:
+            failed = and_(
+                failed,
+                StripeEvent.attempts < MAX_EVENT_ATTEMPTS,
+                or_(StripeEvent.next_attempt_at.is_(None), StripeEvent.next_attempt_at <= now),
+            )
+        return or_(
+            failed,
+            and_(
+                StripeEvent.status == "pending",
+                StripeEvent.created_at < now - _REPLAY_PENDING_AFTER,
+            ),
+            and_(
+                StripeEvent.status == "processing",
+                StripeEvent.claimed_at < now - _STALE_CLAIM_AFTER,
+            ),
+        )
+    
+    def _claim(self, *criteria) -> StripeEvent | None:
+        """Atomically move a matching event to "processing"; None if no longer matching"""
+        record = self.db.scalar(
+            update(StripeEvent)
+            .where(*criteria)
+            .values(
+                status="processing",
+                claimed_at=naive_utcnow(),
+                attempts=StripeEvent.attempts + 1,
+            )
+            .returning(StripeEvent)
+        )
+        self.db.commit()
+        return record
+    
+    def _finish(self, record: StripeEvent) -> None:
+        """Run a claimed event and commit its outcome"""
+        error = self._run_event(record.type, record.payload)
+        
+        now = naive_utcnow()
+        record.status = "failed" if error else "processed"
+        record.error = error
+        record.processed_at = now
+        record.next_attempt_at = None
+        if error:
+            if record.attempts < MAX_EVENT_ATTEMPTS:
+                delay = min(_RETRY_BASE * 2 ** (record.attempts - 1), _RETRY_CAP)
+                record.next_attempt_at = now + delay
+                logger.warning(f"Stripe event {record.id} failed (attempt {record.attempts}), retrying in {delay}")
+            else:
+                logger.error(f"Stripe event {record.id} failed after {record.attempts} attempts, giving up")
+        self.db.commit()
+    
+    def _run_event(self, event_type: str, payload: dict) -> str | None:
+        """Route one event to its handler; returns the error message on failure"""
+        event = stripe.Event.construct_from(payload, stripe.api_key)
+        
         # Route to appropriate handler
         handlers = {
             "checkout.session.completed": self._handle_checkout_completed,
@@ -66,16 +252,16 @@ class StripeWebhookHandler:
         }
         
         handler = handlers.get(event_type)
-        if handler:
-            try:
+        try:
+            if handler:
                 handler(event)
-            except Exception as e:
-                logger.error(f"Error handling {event_type}: {e}")
-                raise HTTPException(status_code=500, detail=str(e))
-        else:
-            logger.info(f"Unhandled event type: {event_type}")
-        
-        return {"status": "success"}
+            else:
+                logger.info(f"Unhandled event type: {event_type}")
+            return None
+        except Exception as e:
+            logger.error(f"Error handling {event_type} ({event['id']}): {e}")
+            self.db.rollback()
+            return str(e)
     
     def _handle_checkout_completed(self, event: dict):
         """
@@ -92,18 +278,14 @@ class StripeWebhookHandler:
         customer_email = session.get("customer_email") or session.get("customer_details", {}).get("email")
         metadata = session.get("metadata") or {}
 
-        # Get subscription details from Stripe
-        subscription = stripe.Subscription.retrieve(subscription_id)
-        plan_id = subscription["items"]["data"][0]["price"]["id"]
-
-        # Map Stripe price ID to plan name (keep in sync with billing.py)
-        plan_mapping = {
-            "price_1SrGI3PcAaj5IlzyqjJ9kioz": "starter",
-            "price_1SrGJJPcAaj5Ilzy0KOKspNI": "pro",
-            "price_1SrGJsPcAaj5IlzyBbgP2Ys4": "museum",
-        }
-
-        plan = plan_mapping.get(plan_id, "starter")
+        # Sessions from /api/billing/checkout carry the plan in metadata.
+        # Webhook payloads are never expanded, so anything else still needs
+        # the subscription fetched from Stripe to read its price
+        plan = metadata.get("plan")
+        if plan not in PLAN_TO_PRICE:
+            subscription = stripe.Subscription.retrieve(subscription_id)
+            plan_id = subscription["items"]["data"][0]["price"]["id"]
+            plan = PRICE_TO_PLAN.get(plan_id, "starter")
 
         # Resolve user — prefer user_id from checkout metadata (most reliable)
         from .models import User
@@ -132,12 +314,18 @@ class StripeWebhookHandler:
             stripe_event_id=event["id"]
         )
         
+        # Raise unless the tenant is live, so the event is recorded as failed
+        # (and retried) rather than processed
         if error:
             logger.error(f"Provisioning failed: {error}")
             # In production, send notification email to support
-        else:
-            logger.info(f"Successfully provisioned tenant: {tenant.namespace}")
-            # In production, send welcome email to customer
+            raise RuntimeError(f"Provisioning failed: {error}")
+        if tenant is None or tenant.status != TenantStatus.ACTIVE:
+            state = f"{tenant.namespace} is {tenant.status}" if tenant else "no tenant recorded yet"
+            raise RuntimeError(f"Tenant for subscription {subscription_id} not active ({state})")
+        
+        logger.info(f"Successfully provisioned tenant: {tenant.namespace}")
+        # In production, send welcome email to customer
     
     def _handle_subscription_updated(self, event: dict):
         """
@@ -242,3 +430,46 @@ class StripeWebhookHandler:
         if subscription and subscription.tenant.status != "active":
             logger.info(f"Payment succeeded, resuming tenant for {subscription_id}")
             self.provisioner.resume_tenant(subscription.tenant_id)
+
+
+def process_stripe_event(event_id: str) -> None:
+    """
+    Background entry point for a stored Stripe event (runs on
+    _DISPATCH_POOL). Opens its own session: the request's session is
+    closed once the response is sent.
+    """
+    db = SessionLocal()
+    try:
+        StripeWebhookHandler(db).dispatch(event_id)
+    except Exception:
+        # Nothing awaits the future, so an escaping error would vanish silently
+        logger.exception(f"Dispatch of Stripe event {event_id} failed")
+    finally:
+        db.close()
+
+
+def replay_stripe_events(limit: int, force: bool = False) -> None:
+    """Background entry point for StripeWebhookHandler.replay (runs on _DISPATCH_POOL)"""
+    db = SessionLocal()
+    try:
+        replayed = StripeWebhookHandler(db).replay(limit, force)
+        if replayed:
+            logger.info(f"Replayed {replayed} Stripe events")
+    except Exception:
+        logger.exception("Stripe event replay failed")
+    finally:
+        db.close()
+
+
+def submit_stripe_replay(limit: int, force: bool = False) -> bool:
+    """
+    Queue a replay batch on the dispatch pool, bounded with the dispatches.
+    At most one batch is queued or running per worker; returns False (and
+    queues nothing) while the previous one is unfinished.
+    """
+    global _replay_future
+    with _REPLAY_LOCK:
+        if _replay_future is not None and not _replay_future.done():
+            return False
+        _replay_future = _DISPATCH_POOL.submit(replay_stripe_events, limit, force)
+        return True
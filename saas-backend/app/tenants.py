@@ -8,6 +8,7 @@ GET    /api/tenants/{id}/metrics → live pod status from Kubernetes
 """
 import logging
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from typing import Optional
@@ -17,7 +18,7 @@ from .auth import get_current_user
 from .database import get_db
 from .models import Tenant, TenantStatus, User, Subscription
 from .provisioning import TenantProvisioner
-from .k8s import KubernetesManager
+from .k8s import get_k8s
 
 logger = logging.getLogger(__name__)
 
@@ -40,8 +41,7 @@ class TenantOut(BaseModel):
     created_at: datetime
     deployed_at: Optional[datetime] = None
 
-    class Config:
-        from_attributes = True
+    model_config = {"from_attributes": True}
 
 
 class TenantListOut(BaseModel):
@@ -82,7 +82,12 @@ def list_tenants(
         .order_by(Tenant.created_at.desc())
         .all()
     )
-    return {"tenants": tenants, "total": len(tenants)}
+    # Serialize once and skip FastAPI's second validation pass (response_model
+    # stays for the OpenAPI schema)
+    return ORJSONResponse({
+        "tenants": [TenantOut.model_validate(t).model_dump() for t in tenants],
+        "total": len(tenants),
+    })
 
 
 @router.get("/{tenant_id}", response_model=TenantOut)
@@ -130,7 +135,7 @@ def get_tenant_metrics(
     tenant = get_owned_tenant(tenant_id, current_user, db)
 
     try:
-        k8s = KubernetesManager()
+        k8s = get_k8s()
         pod_status = k8s.get_pod_status(tenant.namespace)
     except Exception as e:
         logger.error(f"K8s metrics failed for tenant {tenant_id}: {e}")
@@ -0,0 +1,8 @@
+"""
+Test configuration: minimal settings so app modules import without a .env
+(real environment variables still win)
+"""
+import os
+
+os.environ.setdefault("APP_URL", "http://localhost:3000")
+os.environ.setdefault("STRIPE_WEBHOOK_SECRET", "whsec_test_secret")
@@ -0,0 +1,121 @@
+"""
+Stripe webhook signature verification: app.stripe_webhooks._verify_signature
+must accept and reject exactly what the Stripe SDK's verifier does
+"""
+import hashlib
+import hmac
+import time
+
+import pytest
+import stripe
+
+from app.config import settings
+from app.stripe_webhooks import SIGNATURE_TOLERANCE, _verify_signature
+
+SECRET = settings.STRIPE_WEBHOOK_SECRET
+PAYLOAD = b'{"id": "evt_test", "type": "checkout.session.completed"}'
+
+
+def _sign(payload: bytes, timestamp: int, secret: str = SECRET) -> str:
+    """v1 signature as Stripe computes it"""
+    signed = f"{timestamp}.".encode() + payload
+    return hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+
+
+def _header(payload: bytes = PAYLOAD, timestamp: int | None = None, secret: str = SECRET) -> str:
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    return f"t={timestamp},v1={_sign(payload, timestamp, secret)}"
+
+
+def _sdk_accepts(payload: bytes, header: str) -> bool:
+    try:
+        stripe.WebhookSignature.verify_header(
+            payload.decode(), header, SECRET, tolerance=SIGNATURE_TOLERANCE
+        )
+        return True
+    except stripe.error.SignatureVerificationError:
+        return False
+
+
+def _ours_accepts(payload: bytes, header: str) -> bool:
+    try:
+        _verify_signature(payload, header)
+        return True
+    except stripe.error.SignatureVerificationError:
+        return False
+
+
+def test_valid_signature_accepted():
+    header = _header()
+    assert _ours_accepts(PAYLOAD, header)
+    assert _sdk_accepts(PAYLOAD, header)
+
+
+def test_sdk_header_round_trip():
+    # Header built from the SDK's own signature computation
+    timestamp = int(time.time())
+    signature = stripe.WebhookSignature._compute_signature(
+        f"{timestamp}.{PAYLOAD.decode()}", SECRET
+    )
+    header = f"t={timestamp},v1={signature}"
+    assert _ours_accepts(PAYLOAD, header)
+
+
+def test_any_matching_v1_accepted():
+    # Stripe sends several v1 values while a webhook secret is being rolled
+    timestamp = int(time.time())
+    header = (
+        f"t={timestamp},"
+        f"v1={_sign(PAYLOAD, timestamp, 'whsec_old_secret')},"
+        f"v1={_sign(PAYLOAD, timestamp)},"
+        f"v0=ignored"
+    )
+    assert _ours_accepts(PAYLOAD, header)
+    assert _sdk_accepts(PAYLOAD, header)
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        f"v1={'0' * 64}",                          # no timestamp
+        f"t=,v1={'0' * 64}",                       # empty timestamp
+        f"t=abc,v1={'0' * 64}",                    # non-numeric timestamp
+        f"t={int(time.time())}",                   # no v1 signature
+        "garbage",
+    ],
+)
+def test_malformed_header_rejected(header):
+    assert not _ours_accepts(PAYLOAD, header)
+    assert not _sdk_accepts(PAYLOAD, header)
+
+
+def test_non_numeric_timestamp_with_valid_signature_rejected():
+    timestamp = int(time.time())
+    header = f"t={timestamp}x,v1={_sign(PAYLOAD, timestamp)}"
+    assert not _ours_accepts(PAYLOAD, header)
+    assert not _sdk_accepts(PAYLOAD, header)
+
+
+def test_wrong_secret_rejected():
+    header = _header(secret="whsec_someone_else")
+    assert not _ours_accepts(PAYLOAD, header)
+    assert not _sdk_accepts(PAYLOAD, header)
+
+
+def test_tampered_payload_rejected():
+    header = _header()
+    tampered = PAYLOAD.replace(b"evt_test", b"evt_evil")
+    assert not _ours_accepts(tampered, header)
+    assert not _sdk_accepts(tampered, header)
+
+
+def test_stale_timestamp_rejected():
+    header = _header(timestamp=int(time.time()) - SIGNATURE_TOLERANCE - 60)
+    assert not _ours_accepts(PAYLOAD, header)
+    assert not _sdk_accepts(PAYLOAD, header)
+
+
+def test_timestamp_inside_tolerance_accepted():
+    header = _header(timestamp=int(time.time()) - SIGNATURE_TOLERANCE + 60)
+    assert _ours_accepts(PAYLOAD, header)
+    assert _sdk_accepts(PAYLOAD, header)